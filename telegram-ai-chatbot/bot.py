@@ -4,12 +4,15 @@ Main bot file for Telegram AI Chatbot
 import asyncio
 import logging
 import sys
+from typing import Optional, Union
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from config import Config
-from database.queries import Database
 from handlers import user, admin
+from services.loop_monitor import UpdateContextMiddleware, install_slow_callback_monitor
+from services.tenants import TenantRegistry, TenantMiddleware
 
 logging.basicConfig(
     level=getattr(logging, Config.LOG_LEVEL()),
@@ -23,30 +26,48 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def main() -> None:
-    """Main function to start the bot"""
+async def main(manifest: Union[str, list, None] = None) -> None:
+    """
+    Main function to start the bot
+    
+    Args:
+        manifest: Tenant manifest (path to JSON file or list of tenant dicts).
+            Without it TENANTS_FILE is used, or a single bot from .env.
+    """
+    registry: Optional[TenantRegistry] = None
+    session: Optional[AiohttpSession] = None
     try:
-        Config.validate()
-        logger.info("Configuration validated successfully")
+        tenant_configs = Config.load_tenants(manifest)
+        logger.info(f"Configuration validated successfully, {len(tenant_configs)} tenant(s)")
         
-        db = Database()
-        await db.init_db()
-        logger.info("Database initialized")
+        registry = TenantRegistry(tenant_configs)
+        await registry.start()
+        logger.info("Databases initialized")
         
-        bot = Bot(
-            token=Config.TELEGRAM_TOKEN(),
-            default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-        )
+        session = AiohttpSession()
+        bots = [
+            Bot(
+                token=tenant_config.token,
+                session=session,
+                default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+            )
+            for tenant_config in tenant_configs
+        ]
         dp = Dispatcher()
+        dp.update.outer_middleware(TenantMiddleware(registry))
+        dp.message.middleware(UpdateContextMiddleware())
+        install_slow_callback_monitor()
         
-        dp.include_router(user.router)
         dp.include_router(admin.router)
+        dp.include_router(user.router)
         logger.info("Routers registered")
         
-        bot_info = await bot.get_me()
-        logger.info(f"Bot started: @{bot_info.username} ({bot_info.first_name})")
+        for bot in bots:
+            bot_info = await bot.get_me()
+            tenant = registry.get(bot.id)
+            logger.info(f"Bot started: @{bot_info.username} ({bot_info.first_name}), tenant {tenant.name}")
         
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        await dp.start_polling(*bots, allowed_updates=dp.resolve_used_update_types())
         
     except ValueError as e:
         logger.error(f"Configuration error: {e}")
@@ -57,14 +78,15 @@ async def main() -> None:
         logger.error(f"Unexpected error: {e}", exc_info=True)
         sys.exit(1)
     finally:
-        if 'bot' in locals():
-            await bot.session.close()
+        if registry is not None:
+            await registry.stop()
+        if session is not None:
+            await session.close()
         logger.info("Bot session closed")
 
-
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
     except KeyboardInterrupt:
         logger.info("Bot stopped")
     except Exception as e:
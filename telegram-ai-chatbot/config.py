@@ -1,9 +1,12 @@
 """
 Configuration module for Telegram AI Chatbot
 """
+import json
 import os
+import re
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 try:
     base_dir = Path(__file__).parent.absolute()
@@ -47,8 +50,26 @@ class Config:
     
     DEFAULT_MODEL: str = "gpt-4o"
     AVAILABLE_MODELS: list[str] = ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"]
+    AUTO_MODEL: str = "auto"
+    ROUTER_SHORT_PROMPT_TOKENS: int = 300
+    ROUTER_MAX_LIGHT_PROMPT_TOKENS: int = 8000
+    ROUTER_LATENCY_WINDOW: int = 50
+    ROUTER_MIN_SAMPLES: int = 5
+    REQUEST_DEADLINE: float = 45.0
+    HEDGING_ENABLED: bool = True
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_DEFAULT_DELAY: float = 10.0
+    SLOW_CALLBACK_THRESHOLD: float = 0.1
+    PROFILE_MAX_SECONDS: int = 60
+    PROFILE_SAMPLE_INTERVAL: float = 0.005
+    PROFILE_TOP_N: int = 15
     CONVERSATION_HISTORY_LIMIT: int = 10
     DATABASE_PATH: str = "bot_database.db"
+    USAGE_BATCH_SIZE: int = 20
+    USAGE_FLUSH_INTERVAL: float = 30.0
+    USAGE_MAX_BUFFER: int = 1000
+    USAGE_REPORT_DAYS: int = 7
+    USAGE_REPORT_TOP: int = 10
     
     @classmethod
     def TELEGRAM_TOKEN(cls) -> str:
@@ -72,12 +93,16 @@ class Config:
         return os.getenv("LOG_LEVEL", "INFO")
     
     @classmethod
-    def validate(cls) -> bool:
+    def TENANTS_FILE(cls) -> str:
+        return os.getenv("TENANTS_FILE", "")
+    
+    @classmethod
+    def validate(cls, require_token: bool = True) -> bool:
         """Validate that required configuration is present"""
         token = cls.TELEGRAM_TOKEN()
         api_key = cls.OPENAI_API_KEY()
         
-        if not token:
+        if require_token and not token:
             env_path = base_dir / ".env"
             error_msg = (
                 f"TELEGRAM_TOKEN is not set in environment variables.\n"
@@ -96,6 +121,91 @@ class Config:
         return True
     
     @classmethod
-    def is_admin(cls, user_id: int) -> bool:
-        """Check if user is admin"""
-        return user_id in cls.ADMIN_IDS()
+    def load_tenants(cls, manifest: Union[str, list, None] = None) -> list["TenantConfig"]:
+        """
+        Load tenant configurations
+        
+        Args:
+            manifest: Path to a JSON manifest, a list of tenant dicts, or None
+                to use TENANTS_FILE or a single tenant from environment variables
+        """
+        if manifest is None:
+            manifest = cls.TENANTS_FILE() or None
+        
+        if manifest is None:
+            cls.validate()
+            return [TenantConfig(
+                name="default",
+                token=cls.TELEGRAM_TOKEN(),
+                admin_ids=cls.ADMIN_IDS()
+            )]
+        
+        cls.validate(require_token=False)
+        if isinstance(manifest, str):
+            try:
+                with open(manifest, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                raise ValueError(f"Cannot read tenant manifest {manifest}: {e}")
+        
+        if not isinstance(manifest, list) or not manifest:
+            raise ValueError("Tenant manifest must be a non-empty list of tenants")
+        
+        tenants = [TenantConfig.from_dict(entry, index) for index, entry in enumerate(manifest)]
+        for attr in ("name", "token", "bot_id", "database_path"):
+            values = [getattr(tenant, attr) for tenant in tenants]
+            if len(set(values)) != len(values):
+                raise ValueError(f"Tenant manifest has duplicate {attr} values")
+        return tenants
+
+
+@dataclass
+class TenantConfig:
+    """Settings of one bot served by this process"""
+    name: str
+    token: str
+    admin_ids: list[int] = field(default_factory=list)
+    default_model: str = Config.DEFAULT_MODEL
+    database_path: str = Config.DATABASE_PATH
+    
+    TOKEN_PATTERN = re.compile(r"^\d+:[\w-]+$")
+    
+    def __post_init__(self):
+        if not self.TOKEN_PATTERN.match(self.token):
+            raise ValueError(f"Tenant {self.name} has a malformed token, expected <bot id>:<secret>")
+    
+    @property
+    def bot_id(self) -> int:
+        """Telegram bot ID encoded in the token"""
+        return int(self.token.split(":", 1)[0])
+    
+    @classmethod
+    def from_dict(cls, data: dict, index: int = 0) -> "TenantConfig":
+        """Create tenant config from a manifest entry"""
+        if not isinstance(data, dict) or not data.get("token"):
+            raise ValueError(f"Tenant #{index} in manifest has no token")
+        
+        name = str(data.get("name") or f"tenant{index}")
+        default_model = data.get("default_model", Config.DEFAULT_MODEL)
+        if default_model not in Config.AVAILABLE_MODELS and default_model != Config.AUTO_MODEL:
+            raise ValueError(f"Tenant {name} has unknown default_model {default_model}")
+        
+        admins = data.get("admins", [])
+        try:
+            admin_ids = [int(admin_id) for admin_id in admins] if isinstance(admins, list) else None
+        except (TypeError, ValueError):
+            admin_ids = None
+        if admin_ids is None:
+            raise ValueError(f"Tenant {name} has invalid admins, expected a list of user IDs")
+        
+        return cls(
+            name=name,
+            token=data["token"],
+            admin_ids=admin_ids,
+            default_model=default_model,
+            database_path=data.get("db_path", f"bot_database_{name}.db")
+        )
+    
+    def is_admin(self, user_id: int) -> bool:
+        """Check if user is admin of this tenant"""
+        return user_id in self.admin_ids
@@ -40,3 +40,29 @@ class Conversation:
             "content": self.content,
             "timestamp": self.timestamp.isoformat()
         }
+
+
+@dataclass
+class UsageRecord:
+    """Token usage and latency of a single completion, `discarded` if its answer was not used"""
+    user_id: Optional[int]
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    latency_ms: float
+    created_at: datetime
+    discarded: bool = False
+
+    def to_dict(self) -> dict:
+        """Convert usage record to dictionary"""
+        return {
+            "user_id": self.user_id,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "latency_ms": self.latency_ms,
+            "created_at": self.created_at.isoformat(),
+            "discarded": self.discarded
+        }
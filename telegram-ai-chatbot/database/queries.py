@@ -3,9 +3,10 @@ Database queries for Telegram AI Chatbot
 """
 import aiosqlite
 import logging
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List
-from database.models import User, Conversation
+from database.models import User, Conversation, UsageRecord
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -46,12 +47,89 @@ class Database:
                     ON conversations(user_id, timestamp DESC)
                 """)
                 
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS user_settings (
+                        user_id INTEGER PRIMARY KEY,
+                        model TEXT
+                    )
+                """)
+                
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT NOT NULL
+                    )
+                """)
+                
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS usage_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        user_id INTEGER,
+                        model TEXT NOT NULL,
+                        prompt_tokens INTEGER NOT NULL,
+                        completion_tokens INTEGER NOT NULL,
+                        total_tokens INTEGER NOT NULL,
+                        latency_ms REAL NOT NULL,
+                        created_at TIMESTAMP NOT NULL,
+                        discarded INTEGER NOT NULL DEFAULT 0
+                    )
+                """)
+                
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS usage_daily_user (
+                        day TEXT NOT NULL,
+                        user_id INTEGER NOT NULL,
+                        request_count INTEGER NOT NULL DEFAULT 0,
+                        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                        completion_tokens INTEGER NOT NULL DEFAULT 0,
+                        total_tokens INTEGER NOT NULL DEFAULT 0,
+                        latency_ms_sum REAL NOT NULL DEFAULT 0,
+                        discarded_count INTEGER NOT NULL DEFAULT 0,
+                        discarded_tokens INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (day, user_id)
+                    )
+                """)
+                
+                await db.execute("""
+                    CREATE TABLE IF NOT EXISTS usage_daily_model (
+                        day TEXT NOT NULL,
+                        model TEXT NOT NULL,
+                        request_count INTEGER NOT NULL DEFAULT 0,
+                        prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                        completion_tokens INTEGER NOT NULL DEFAULT 0,
+                        total_tokens INTEGER NOT NULL DEFAULT 0,
+                        latency_ms_sum REAL NOT NULL DEFAULT 0,
+                        discarded_count INTEGER NOT NULL DEFAULT 0,
+                        discarded_tokens INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (day, model)
+                    )
+                """)
+                
+                await self._add_missing_columns(db, "usage_log", {
+                    "discarded": "INTEGER NOT NULL DEFAULT 0",
+                })
+                for table in ("usage_daily_user", "usage_daily_model"):
+                    await self._add_missing_columns(db, table, {
+                        "discarded_count": "INTEGER NOT NULL DEFAULT 0",
+                        "discarded_tokens": "INTEGER NOT NULL DEFAULT 0",
+                    })
+                
                 await db.commit()
                 logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {e}")
             raise
     
+    @staticmethod
+    async def _add_missing_columns(db: aiosqlite.Connection, table: str, columns: dict) -> None:
+        """Add columns introduced after the table was created"""
+        async with db.execute(f"PRAGMA table_info({table})") as cursor:
+            existing = {row[1] for row in await cursor.fetchall()}
+        for column, definition in columns.items():
+            if column not in existing:
+                await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+                logger.info(f"Added column {table}.{column}")
+    
     async def add_user(self, user_id: int, username: Optional[str], first_name: Optional[str]) -> None:
         """Add or update user"""
         try:
@@ -167,3 +245,179 @@ class Database:
         except Exception as e:
             logger.error(f"Error getting message count: {e}")
             return 0
+    
+    async def get_user_model(self, user_id: int) -> Optional[str]:
+        """Get model chosen by user, None if user uses the default"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                async with db.execute(
+                    "SELECT model FROM user_settings WHERE user_id = ?", (user_id,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                    return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting model for user {user_id}: {e}")
+            return None
+    
+    async def set_user_model(self, user_id: int, model: Optional[str]) -> None:
+        """Set model for user, None resets to the default"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                if model is None:
+                    await db.execute("DELETE FROM user_settings WHERE user_id = ?", (user_id,))
+                else:
+                    await db.execute("""
+                        INSERT INTO user_settings (user_id, model) VALUES (?, ?)
+                        ON CONFLICT(user_id) DO UPDATE SET model = excluded.model
+                    """, (user_id, model))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error setting model for user {user_id}: {e}")
+            raise
+    
+    async def get_setting(self, key: str) -> Optional[str]:
+        """Get global setting value"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                async with db.execute(
+                    "SELECT value FROM settings WHERE key = ?", (key,)
+                ) as cursor:
+                    row = await cursor.fetchone()
+                    return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error getting setting {key}: {e}")
+            return None
+    
+    async def set_setting(self, key: str, value: str) -> None:
+        """Set global setting value"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("""
+                    INSERT INTO settings (key, value) VALUES (?, ?)
+                    ON CONFLICT(key) DO UPDATE SET value = excluded.value
+                """, (key, value))
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error setting {key}: {e}")
+            raise
+    
+    async def add_usage_records(self, records: List[UsageRecord]) -> None:
+        """
+        Append usage records and update daily rollups in one transaction
+        
+        Discarded records only add to the rollups' discarded_count and
+        discarded_tokens, so request counts, token averages and latency
+        describe answers that were actually used.
+        """
+        if not records:
+            return
+        
+        by_user = defaultdict(lambda: [0, 0, 0, 0, 0.0, 0, 0])
+        by_model = defaultdict(lambda: [0, 0, 0, 0, 0.0, 0, 0])
+        for record in records:
+            day = record.created_at.date().isoformat()
+            keys = [(by_model, (day, record.model))]
+            if record.user_id is not None:
+                keys.append((by_user, (day, record.user_id)))
+            for rollup, key in keys:
+                totals = rollup[key]
+                if record.discarded:
+                    totals[5] += 1
+                    totals[6] += record.total_tokens
+                    continue
+                totals[0] += 1
+                totals[1] += record.prompt_tokens
+                totals[2] += record.completion_tokens
+                totals[3] += record.total_tokens
+                totals[4] += record.latency_ms
+        
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.executemany("""
+                    INSERT INTO usage_log (user_id, model, prompt_tokens, completion_tokens,
+                                           total_tokens, latency_ms, created_at, discarded)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [
+                    (r.user_id, r.model, r.prompt_tokens, r.completion_tokens,
+                     r.total_tokens, r.latency_ms, r.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+                     int(r.discarded))
+                    for r in records
+                ])
+                
+                for table, column, rollup in (
+                    ("usage_daily_user", "user_id", by_user),
+                    ("usage_daily_model", "model", by_model),
+                ):
+                    await db.executemany(f"""
+                        INSERT INTO {table} (day, {column}, request_count, prompt_tokens,
+                                             completion_tokens, total_tokens, latency_ms_sum,
+                                             discarded_count, discarded_tokens)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT(day, {column}) DO UPDATE SET
+                            request_count = request_count + excluded.request_count,
+                            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                            completion_tokens = completion_tokens + excluded.completion_tokens,
+                            total_tokens = total_tokens + excluded.total_tokens,
+                            latency_ms_sum = latency_ms_sum + excluded.latency_ms_sum,
+                            discarded_count = discarded_count + excluded.discarded_count,
+                            discarded_tokens = discarded_tokens + excluded.discarded_tokens
+                    """, [(day, key, *totals) for (day, key), totals in rollup.items()])
+                
+                await db.commit()
+        except Exception as e:
+            logger.error(f"Error adding {len(records)} usage records: {e}")
+            raise
+    
+    @staticmethod
+    def _usage_since(days: int) -> str:
+        """First day (UTC) included in a report covering the last `days` days"""
+        return (datetime.now(timezone.utc) - timedelta(days=max(days, 1) - 1)).date().isoformat()
+    
+    async def get_top_users_by_usage(self, days: int = Config.USAGE_REPORT_DAYS,
+                                     limit: int = Config.USAGE_REPORT_TOP) -> List[dict]:
+        """Get users with the highest token usage over the last days"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                async with db.execute("""
+                    SELECT u.user_id, users.username, users.first_name,
+                           SUM(u.request_count) AS request_count,
+                           SUM(u.total_tokens) AS total_tokens,
+                           SUM(u.discarded_tokens) AS discarded_tokens
+                    FROM usage_daily_user u
+                    LEFT JOIN users ON users.user_id = u.user_id
+                    WHERE u.day >= ?
+                    GROUP BY u.user_id
+                    ORDER BY total_tokens DESC
+                    LIMIT ?
+                """, (self._usage_since(days), limit)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting top users by usage: {e}")
+            return []
+    
+    async def get_model_usage(self, days: int = Config.USAGE_REPORT_DAYS) -> List[dict]:
+        """Get per-model totals and averages over the last days"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                async with db.execute("""
+                    SELECT model,
+                           SUM(request_count) AS request_count,
+                           SUM(total_tokens) AS total_tokens,
+                           SUM(discarded_count) AS discarded_count,
+                           SUM(discarded_tokens) AS discarded_tokens,
+                           1.0 * SUM(prompt_tokens) / NULLIF(SUM(request_count), 0) AS avg_prompt_tokens,
+                           1.0 * SUM(completion_tokens) / NULLIF(SUM(request_count), 0) AS avg_completion_tokens,
+                           SUM(latency_ms_sum) / NULLIF(SUM(request_count), 0) AS avg_latency_ms
+                    FROM usage_daily_model
+                    WHERE day >= ?
+                    GROUP BY model
+                    ORDER BY total_tokens DESC
+                """, (self._usage_since(days),)) as cursor:
+                    rows = await cursor.fetchall()
+                    return [dict(row) for row in rows]
+        except Exception as e:
+            logger.error(f"Error getting model usage: {e}")
+            return []
@@ -2,33 +2,30 @@
 Admin command handlers
 """
 import logging
+from html import escape
 from aiogram import Router
-from aiogram.types import Message
+from aiogram.types import Message, BufferedInputFile
 from aiogram.filters import Command
-from database.queries import Database
+from services.profiler import SamplingProfiler, ProfilerBusyError
+from services.tenants import Tenant
 from config import Config
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-db = Database()
-
-
-def is_admin(user_id: int) -> bool:
-    """Check if user is admin"""
-    return Config.is_admin(user_id)
+profiler = SamplingProfiler()
 
 
 @router.message(Command("stats"))
-async def cmd_stats(message: Message) -> None:
+async def cmd_stats(message: Message, tenant: Tenant) -> None:
     """Handle /stats command - show bot statistics (admin only)"""
-    if not is_admin(message.from_user.id):
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("❌ Эта команда доступна только администраторам.")
         return
     
     try:
-        user_count = await db.get_user_count()
-        message_count = await db.get_message_count()
+        user_count = await tenant.db.get_user_count()
+        message_count = await tenant.db.get_message_count()
         
         stats_text = (
             "📊 <b>Статистика бота:</b>\n\n"
@@ -36,12 +33,29 @@ async def cmd_stats(message: Message) -> None:
             f"💬 Всего сообщений: <b>{message_count}</b>\n"
         )
         
-        try:
-            from services.openai_service import OpenAIService
-            openai_service = OpenAIService()
-            stats_text += f"🤖 Текущая модель: <b>{openai_service.get_model()}</b>\n"
-        except:
-            pass
+        stats_text += f"🤖 Модель по умолчанию: <b>{tenant.openai_service.get_model()}</b>\n"
+        
+        latencies = []
+        for model in Config.AVAILABLE_MODELS:
+            latency = tenant.openai_service.router.average_latency(model)
+            if latency is not None:
+                latencies.append(f"• {model}: {latency:.0f} мс")
+        if latencies:
+            stats_text += "\n⏱ <b>Средняя задержка:</b>\n" + "\n".join(latencies) + "\n"
+        
+        completion_stats = tenant.openai_service.get_completion_stats()
+        if completion_stats["requests"]:
+            stats_text += (
+                f"\n🛡 <b>Запросы к AI:</b> {completion_stats['requests']}\n"
+                f"• Хеджирование: {completion_stats['hedge_rate']:.1%} "
+                f"(выиграли {completion_stats['hedge_wins']} из {completion_stats['hedged']})\n"
+                f"• Фолбэк после ошибки: {completion_stats['fallback_rate']:.1%} "
+                f"(успешно {completion_stats['fallback_wins']} из {completion_stats['fallbacks']})\n"
+                f"• Превышение дедлайна: {completion_stats['deadline_miss_rate']:.1%}\n"
+                f"• Отменённые запросы: {completion_stats['cancelled_attempts']} "
+                f"(~{completion_stats['cancelled_prompt_tokens']} токенов промпта)\n"
+                f"• Лишние ответы: {completion_stats['discarded_answers']}\n"
+            )
         
         await message.answer(stats_text, parse_mode="HTML")
         logger.info(f"Admin {message.from_user.id} requested stats")
@@ -51,10 +65,131 @@ async def cmd_stats(message: Message) -> None:
         await message.answer("Произошла ошибка при получении статистики.")
 
 
+@router.message(Command("usage"))
+async def cmd_usage(message: Message, tenant: Tenant) -> None:
+    """Handle /usage command - show token usage by user and model (admin only)"""
+    if not tenant.is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администраторам.")
+        return
+    
+    command_parts = message.text.split()
+    days = Config.USAGE_REPORT_DAYS
+    if len(command_parts) > 1:
+        if not command_parts[1].isdigit() or int(command_parts[1]) < 1:
+            await message.answer(
+                "Использование: /usage [дней]\n\n"
+                f"По умолчанию показывает статистику за {Config.USAGE_REPORT_DAYS} дн."
+            )
+            return
+        days = int(command_parts[1])
+    
+    try:
+        await tenant.usage_tracker.flush()
+        top_users = await tenant.db.get_top_users_by_usage(days=days)
+        model_usage = await tenant.db.get_model_usage(days=days)
+        
+        if not top_users and not model_usage:
+            await message.answer(f"Нет данных об использовании за {days} дн.")
+            return
+        
+        usage_text = f"📈 <b>Использование токенов за {days} дн.:</b>\n\n"
+        
+        if top_users:
+            usage_text += "👥 <b>Топ пользователей:</b>\n"
+            for i, row in enumerate(top_users, 1):
+                name = f"@{row['username']}" if row["username"] else (row["first_name"] or str(row["user_id"]))
+                usage_text += (
+                    f"{i}. {escape(name)} — <b>{row['total_tokens']}</b> токенов, "
+                    f"{row['request_count']} запросов"
+                )
+                if row["discarded_tokens"]:
+                    usage_text += f", ~{row['discarded_tokens']} в отменённых"
+                usage_text += "\n"
+            usage_text += "\n"
+        
+        if model_usage:
+            usage_text += "🤖 <b>По моделям:</b>\n"
+            for row in model_usage:
+                usage_text += (
+                    f"• <b>{escape(row['model'])}</b>: {row['request_count']} запросов, "
+                    f"{row['total_tokens']} токенов\n"
+                )
+                if row["request_count"]:
+                    usage_text += (
+                        f"  в среднем {row['avg_prompt_tokens']:.0f} + {row['avg_completion_tokens']:.0f} токенов, "
+                        f"{row['avg_latency_ms']:.0f} мс\n"
+                    )
+                if row["discarded_count"]:
+                    usage_text += (
+                        f"  отменено {row['discarded_count']} запросов, "
+                        f"~{row['discarded_tokens']} токенов\n"
+                    )
+        
+        await message.answer(usage_text, parse_mode="HTML")
+        logger.info(f"Admin {message.from_user.id} requested usage for {days} days")
+        
+    except Exception as e:
+        logger.error(f"Error in cmd_usage: {e}")
+        await message.answer("Произошла ошибка при получении статистики использования.")
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message, tenant: Tenant) -> None:
+    """Handle /profile command - sample the event loop and report hot functions (admin only)"""
+    if not tenant.is_admin(message.from_user.id):
+        await message.answer("❌ Эта команда доступна только администраторам.")
+        return
+    
+    command_parts = message.text.split()
+    if (len(command_parts) < 2 or not command_parts[1].isdigit()
+            or not 1 <= int(command_parts[1]) <= Config.PROFILE_MAX_SECONDS):
+        await message.answer(
+            "Использование: /profile [секунд] [flame]\n\n"
+            f"Профилирует бота от 1 до {Config.PROFILE_MAX_SECONDS} секунд и показывает самые "
+            "горячие функции. С параметром flame также присылает файл для flamegraph."
+        )
+        return
+    
+    seconds = int(command_parts[1])
+    with_flamegraph = len(command_parts) > 2 and command_parts[2].lower() == "flame"
+    
+    try:
+        result = await profiler.run(
+            seconds, on_start=lambda: message.answer(f"⏱ Профилирование {seconds} сек...")
+        )
+        
+        if not result.samples:
+            await message.answer("Не удалось собрать ни одного сэмпла.")
+            return
+        
+        report_text = f"🔥 <b>Горячие функции</b> ({result.samples} сэмплов):\n\n"
+        for label, self_count, total_count in result.top:
+            report_text += (
+                f"<code>{self_count / result.samples:6.1%} {total_count / result.samples:6.1%}</code> "
+                f"{escape(label)}\n"
+            )
+        report_text += "\n<i>Первый столбец - собственное время, второй - вместе с вызванными функциями.</i>"
+        
+        await message.answer(report_text, parse_mode="HTML")
+        
+        if with_flamegraph:
+            await message.answer_document(
+                BufferedInputFile(result.collapsed_stacks.encode("utf-8"), filename="profile.folded"),
+                caption="Свёрнутые стеки для flamegraph.pl / speedscope"
+            )
+        logger.info(f"Admin {message.from_user.id} profiled the bot for {seconds}s")
+        
+    except ProfilerBusyError:
+        await message.answer("⏳ Профилирование уже запущено, дождитесь результата.")
+    except Exception as e:
+        logger.error(f"Error in cmd_profile: {e}")
+        await message.answer("Произошла ошибка при профилировании.")
+
+
 @router.message(Command("broadcast"))
-async def cmd_broadcast(message: Message) -> None:
+async def cmd_broadcast(message: Message, tenant: Tenant) -> None:
     """Handle /broadcast command - send message to all users (admin only)"""
-    if not is_admin(message.from_user.id):
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("❌ Эта команда доступна только администраторам.")
         return
     
@@ -69,7 +204,7 @@ async def cmd_broadcast(message: Message) -> None:
     broadcast_text = command_parts[1]
     
     try:
-        user_ids = await db.get_all_user_ids()
+        user_ids = await tenant.db.get_all_user_ids()
         
         if not user_ids:
             await message.answer("Нет пользователей для рассылки.")
@@ -5,22 +5,23 @@ import logging
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.filters import Command
-from database.queries import Database
-from services.openai_service import OpenAIService
+from services.tenants import Tenant, DEFAULT_MODEL_SETTING
 from config import Config
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-db = Database()
-openai_service = OpenAIService()
+
+def _available_models_text() -> str:
+    """List of models a user can choose from"""
+    return ", ".join(Config.AVAILABLE_MODELS + [Config.AUTO_MODEL])
 
 
 @router.message(Command("start"))
-async def cmd_start(message: Message) -> None:
+async def cmd_start(message: Message, tenant: Tenant) -> None:
     """Handle /start command"""
     try:
-        await db.add_user(
+        await tenant.db.add_user(
             user_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name
@@ -36,7 +37,8 @@ async def cmd_start(message: Message) -> None:
             "<b>Команды:</b>\n"
             "/help - показать все команды\n"
             "/reset - очистить историю диалога\n"
-            "/setmodel - изменить модель AI (только для админов)\n\n"
+            "/model - выбрать свою модель AI\n"
+            "/setmodel - изменить модель по умолчанию (только для админов)\n\n"
             "Просто напишите мне сообщение, и я отвечу! 💬"
         )
         
@@ -56,7 +58,8 @@ async def cmd_help(message: Message) -> None:
         "/start - начать работу с ботом\n"
         "/help - показать эту справку\n"
         "/reset - очистить историю диалога\n"
-        "/setmodel [gpt-4/gpt-3.5] - изменить модель AI (только для админов)\n\n"
+        "/model [модель/auto/default] - выбрать свою модель AI\n"
+        "/setmodel [модель/auto] - изменить модель по умолчанию (только для админов)\n\n"
         "Просто отправьте сообщение, и я отвечу используя ChatGPT! 💬"
     )
     
@@ -64,10 +67,10 @@ async def cmd_help(message: Message) -> None:
 
 
 @router.message(Command("reset"))
-async def cmd_reset(message: Message) -> None:
+async def cmd_reset(message: Message, tenant: Tenant) -> None:
     """Handle /reset command - clear conversation history"""
     try:
-        await db.clear_conversation_history(message.from_user.id)
+        await tenant.db.clear_conversation_history(message.from_user.id)
         await message.answer(
             "✅ История диалога очищена! Можете начать новый разговор.",
             parse_mode="HTML"
@@ -79,39 +82,84 @@ async def cmd_reset(message: Message) -> None:
         await message.answer("Произошла ошибка при очистке истории. Попробуйте позже.")
 
 
+@router.message(Command("model"))
+async def cmd_model(message: Message, tenant: Tenant) -> None:
+    """Handle /model command - choose AI model for this user"""
+    user_id = message.from_user.id
+    command_parts = message.text.split()
+    
+    try:
+        if len(command_parts) < 2:
+            user_model = await tenant.db.get_user_model(user_id)
+            current = user_model or f"{tenant.openai_service.get_model()} (по умолчанию)"
+            await message.answer(
+                f"🤖 Ваша модель: <b>{current}</b>\n\n"
+                f"Использование: /model [модель]\n"
+                f"Доступные модели: {_available_models_text()}\n"
+                f"<b>{Config.AUTO_MODEL}</b> - автоматический выбор модели по размеру запроса\n"
+                f"<b>default</b> - использовать модель по умолчанию",
+                parse_mode="HTML"
+            )
+            return
+        
+        model = command_parts[1].lower()
+        
+        if model == "default":
+            await tenant.db.set_user_model(user_id, None)
+            await message.answer(
+                f"✅ Используется модель по умолчанию: <b>{tenant.openai_service.get_model()}</b>",
+                parse_mode="HTML"
+            )
+        elif tenant.openai_service.is_valid_model(model):
+            await tenant.db.set_user_model(user_id, model)
+            await message.answer(f"✅ Ваша модель изменена на: <b>{model}</b>", parse_mode="HTML")
+        else:
+            await message.answer(
+                f"❌ Неверная модель. Доступные модели: {_available_models_text()}"
+            )
+            return
+        logger.info(f"User {user_id} changed model to {model}")
+        
+    except Exception as e:
+        logger.error(f"Error in cmd_model: {e}")
+        await message.answer("Произошла ошибка при смене модели. Попробуйте позже.")
+
+
 @router.message(Command("setmodel"))
-async def cmd_setmodel(message: Message) -> None:
-    """Handle /setmodel command - change AI model (admin only)"""
-    if not Config.is_admin(message.from_user.id):
+async def cmd_setmodel(message: Message, tenant: Tenant) -> None:
+    """Handle /setmodel command - change default AI model (admin only)"""
+    if not tenant.is_admin(message.from_user.id):
         await message.answer("❌ Эта команда доступна только администраторам.")
         return
     
     command_parts = message.text.split()
     if len(command_parts) < 2:
-        available_models = ", ".join(Config.AVAILABLE_MODELS)
         await message.answer(
             f"Использование: /setmodel [модель]\n\n"
-            f"Доступные модели: {available_models}"
+            f"Доступные модели: {_available_models_text()}"
         )
         return
     
     model = command_parts[1].lower()
     
-    if openai_service.set_model(model):
-        await message.answer(f"✅ Модель изменена на: <b>{model}</b>", parse_mode="HTML")
-        logger.info(f"Admin {message.from_user.id} changed model to {model}")
+    if tenant.openai_service.set_model(model):
+        try:
+            await tenant.db.set_setting(DEFAULT_MODEL_SETTING, model)
+        except Exception as e:
+            logger.error(f"Failed to persist default model {model}: {e}")
+        await message.answer(f"✅ Модель по умолчанию изменена на: <b>{model}</b>", parse_mode="HTML")
+        logger.info(f"Admin {message.from_user.id} changed default model to {model}")
     else:
-        available_models = ", ".join(Config.AVAILABLE_MODELS)
         await message.answer(
-            f"❌ Неверная модель. Доступные модели: {available_models}"
+            f"❌ Неверная модель. Доступные модели: {_available_models_text()}"
         )
 
 
 @router.message(F.text)
-async def handle_message(message: Message) -> None:
+async def handle_message(message: Message, tenant: Tenant) -> None:
     """Handle regular text messages"""
     try:
-        await db.add_user(
+        await tenant.db.add_user(
             user_id=message.from_user.id,
             username=message.from_user.username,
             first_name=message.from_user.first_name
@@ -119,12 +167,15 @@ async def handle_message(message: Message) -> None:
         
         await message.bot.send_chat_action(message.chat.id, "typing")
         
-        history = await db.get_conversation_history(message.from_user.id)
+        history = await tenant.db.get_conversation_history(message.from_user.id)
+        user_model = await tenant.db.get_user_model(message.from_user.id)
         
         try:
-            ai_response = await openai_service.get_response(
+            ai_response = await tenant.openai_service.get_response(
                 user_message=message.text,
-                history=history
+                history=history,
+                user_id=message.from_user.id,
+                model=user_model
             )
         except Exception as e:
             error_message = str(e)
@@ -136,13 +187,13 @@ async def handle_message(message: Message) -> None:
             await message.answer("Извините, не удалось получить ответ. Попробуйте позже.")
             return
         
-        await db.add_message(
+        await tenant.db.add_message(
             user_id=message.from_user.id,
             role="user",
             content=message.text
         )
         
-        await db.add_message(
+        await tenant.db.add_message(
             user_id=message.from_user.id,
             role="assistant",
             content=ai_response
@@ -0,0 +1,87 @@
+"""
+Slow callback monitor for the bot event loop
+"""
+import asyncio
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+current_update: ContextVar[Optional[str]] = ContextVar("current_update", default=None)
+
+_original_handle_run = None
+_entered_in_callback: Optional[str] = None
+
+
+class UpdateContextMiddleware(BaseMiddleware):
+    """Remembers update id and handler name for slow callback reports"""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        global _entered_in_callback
+        update = data.get("event_update")
+        handler_object = data.get("handler")
+        callback = getattr(handler_object, "callback", None)
+        label = (
+            f"update {getattr(update, 'update_id', '?')}, "
+            f"handler {getattr(callback, '__qualname__', '?')}"
+        )
+        _entered_in_callback = label
+        token = current_update.set(label)
+        try:
+            return await handler(event, data)
+        finally:
+            current_update.reset(token)
+
+
+def install_slow_callback_monitor(threshold: float = Config.SLOW_CALLBACK_THRESHOLD) -> None:
+    """
+    Log every event loop callback that runs longer than threshold seconds
+
+    Wraps asyncio.Handle._run the same way asyncio debug mode does, without
+    the rest of debug mode's overhead. The update being handled is taken
+    from the callback's context, set by UpdateContextMiddleware. It is read
+    before the callback runs, because a handler that blocks and then returns
+    resets it within the same callback; a handler entered and finished within
+    one callback is reported through the label the middleware leaves behind.
+    
+    Must be called from the running loop. Loops that do not run callbacks
+    through asyncio.Handle (e.g. uvloop) are left alone.
+    """
+    global _original_handle_run
+    if _original_handle_run is not None:
+        return
+    loop = asyncio.get_running_loop()
+    if not isinstance(loop, asyncio.BaseEventLoop) or not hasattr(asyncio.events.Handle, "_run"):
+        logger.warning(
+            f"Slow callback monitor is not supported by {type(loop).__name__}, not installed"
+        )
+        return
+    _original_handle_run = original_run = asyncio.events.Handle._run
+
+    def _run(self) -> None:
+        global _entered_in_callback
+        context = self._context.get(current_update) if self._context is not None else None
+        _entered_in_callback = None
+        started = time.perf_counter()
+        original_run(self)
+        elapsed = time.perf_counter() - started
+        if elapsed >= threshold:
+            context = context or _entered_in_callback
+            callback = getattr(self._callback, "__self__", self._callback)
+            logger.warning(
+                f"Event loop blocked for {elapsed * 1000:.0f} ms by {callback!r}"
+                f" ({context or 'no update'})"
+            )
+
+    asyncio.events.Handle._run = _run
+    logger.info(f"Slow callback monitor installed (threshold {threshold * 1000:.0f} ms)")
@@ -0,0 +1,99 @@
+"""
+Latency-aware model router for automatic model selection
+"""
+import logging
+from collections import deque
+from typing import Dict, List, Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRouter:
+    """
+    Picks a model for a prompt based on its size and observed latency.
+
+    Config.AVAILABLE_MODELS is ordered from strongest to lightest. Requests
+    are classified by the new user message alone, since the history included
+    in every prompt would make almost all of them look long. Short messages go
+    to the model with the lowest rolling mean latency, long ones to the
+    strongest model. A whole prompt above max_light_prompt_tokens always goes
+    to the strongest model. Models without enough latency samples are tried
+    first, lightest first, so every model gets measured.
+    """
+
+    def __init__(self, models: Optional[List[str]] = None,
+                 short_prompt_tokens: int = Config.ROUTER_SHORT_PROMPT_TOKENS,
+                 max_light_prompt_tokens: int = Config.ROUTER_MAX_LIGHT_PROMPT_TOKENS,
+                 window: int = Config.ROUTER_LATENCY_WINDOW,
+                 min_samples: int = Config.ROUTER_MIN_SAMPLES):
+        self.models = list(models or Config.AVAILABLE_MODELS)
+        self.short_prompt_tokens = short_prompt_tokens
+        self.max_light_prompt_tokens = max_light_prompt_tokens
+        self.min_samples = min_samples
+        self._latencies: Dict[str, deque] = {
+            model: deque(maxlen=window) for model in self.models
+        }
+
+    @staticmethod
+    def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+        """
+        Roughly estimate prompt tokens without a tokenizer
+
+        Counts about 4 ASCII characters or 2 non-ASCII (e.g. Cyrillic)
+        characters per token, plus 4 tokens of overhead per message. This is
+        a heuristic and can be off by tens of percent in either direction.
+        """
+        tokens = 0
+        for m in messages:
+            content = m["content"]
+            non_ascii = sum(1 for ch in content if ord(ch) > 127)
+            tokens += (len(content) - non_ascii) // 4 + non_ascii // 2 + 4
+        return tokens
+
+    def observe(self, model: str, latency_ms: float) -> None:
+        """Record observed latency of a completion"""
+        if model in self._latencies:
+            self._latencies[model].append(latency_ms)
+
+    def average_latency(self, model: str) -> Optional[float]:
+        """Rolling mean latency in milliseconds, None if not enough samples"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        return sum(samples) / len(samples)
+
+    def latency_percentile(self, model: str, percentile: float) -> Optional[float]:
+        """Rolling latency percentile (0..1) in milliseconds, None if not enough samples"""
+        samples = self._latencies.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+    def fastest_model(self) -> str:
+        """Model with the lowest rolling latency"""
+        measured = {}
+        for model in reversed(self.models):
+            latency = self.average_latency(model)
+            if latency is None:
+                return model
+            measured[model] = latency
+        return min(measured, key=measured.get)
+
+    def strongest_model(self) -> str:
+        """Most capable model"""
+        return self.models[0]
+
+    def choose(self, messages: List[Dict[str, str]]) -> str:
+        """Choose a model for the given prompt, the last message being the new user message"""
+        message_tokens = self.estimate_tokens(messages[-1:])
+        prompt_tokens = self.estimate_tokens(messages)
+        if message_tokens <= self.short_prompt_tokens and prompt_tokens <= self.max_light_prompt_tokens:
+            model = self.fastest_model()
+        else:
+            model = self.strongest_model()
+        logger.debug(
+            f"Routed message of ~{message_tokens} tokens (prompt ~{prompt_tokens}) to {model}"
+        )
+        return model
@@ -1,11 +1,15 @@
 """
 OpenAI service for ChatGPT integration
 """
+import asyncio
 import logging
-from typing import List, Dict, Optional
-from openai import AsyncOpenAI, RateLimitError, APIError, APIConnectionError
+import time
+from typing import List, Dict, Optional, Tuple
+from openai import AsyncOpenAI, RateLimitError, APIError, APIConnectionError, APITimeoutError
 from config import Config
 from database.models import Conversation
+from services.model_router import ModelRouter
+from services.usage_tracker import UsageTracker
 
 logger = logging.getLogger(__name__)
 
@@ -13,24 +17,188 @@ logger = logging.getLogger(__name__)
 class OpenAIService:
     """Service for interacting with OpenAI API"""
     
-    def __init__(self, api_key: str = None):
-        if api_key is None:
-            api_key = Config.OPENAI_API_KEY()
-        self.client = AsyncOpenAI(api_key=api_key)
+    def __init__(self, api_key: str = None, usage_tracker: Optional[UsageTracker] = None,
+                 client: Optional[AsyncOpenAI] = None, router: Optional[ModelRouter] = None):
+        if client is None:
+            if api_key is None:
+                api_key = Config.OPENAI_API_KEY()
+            client = AsyncOpenAI(api_key=api_key)
+        self.client = client
         self.current_model = Config.DEFAULT_MODEL
+        self.usage_tracker = usage_tracker
+        self.router = router or ModelRouter()
+        self.stats = {
+            "requests": 0,
+            "hedged": 0,
+            "hedge_wins": 0,
+            "fallbacks": 0,
+            "fallback_wins": 0,
+            "deadline_misses": 0,
+            "cancelled_attempts": 0,
+            "cancelled_prompt_tokens": 0,
+            "discarded_answers": 0,
+        }
+    
+    @staticmethod
+    def is_valid_model(model: str) -> bool:
+        """Check if model can be selected (a known model or automatic routing)"""
+        return model in Config.AVAILABLE_MODELS or model == Config.AUTO_MODEL
     
     def set_model(self, model: str) -> bool:
-        """Set AI model"""
-        if model in Config.AVAILABLE_MODELS:
+        """Set default AI model used by users without their own choice"""
+        if self.is_valid_model(model):
             self.current_model = model
-            logger.info(f"Model changed to {model}")
+            logger.info(f"Default model changed to {model}")
             return True
         return False
     
     def get_model(self) -> str:
-        """Get current AI model"""
+        """Get default AI model"""
         return self.current_model
     
+    def resolve_model(self, messages: List[Dict[str, str]], model: Optional[str] = None) -> str:
+        """Resolve user's choice (or the default) to a concrete model"""
+        if model and not self.is_valid_model(model):
+            logger.warning(f"Stored model {model} is no longer available, using {self.current_model}")
+            model = None
+        model = model or self.current_model
+        if model == Config.AUTO_MODEL:
+            return self.router.choose(messages)
+        return model
+    
+    def get_completion_stats(self) -> Dict[str, float]:
+        """Get hedge, fallback and deadline miss counters and rates"""
+        stats = dict(self.stats)
+        requests = stats["requests"] or 1
+        stats["hedge_rate"] = stats["hedged"] / requests
+        stats["fallback_rate"] = stats["fallbacks"] / requests
+        stats["deadline_miss_rate"] = stats["deadline_misses"] / requests
+        return stats
+    
+    @staticmethod
+    def _fallback_model(model: str) -> str:
+        """Next lighter model, or the same model if it is already the lightest"""
+        models = Config.AVAILABLE_MODELS
+        if model in models and models.index(model) + 1 < len(models):
+            return models[models.index(model) + 1]
+        return model
+    
+    def _hedge_delay(self, model: str) -> float:
+        """Seconds to wait for the primary request before hedging"""
+        latency_ms = self.router.latency_percentile(model, Config.HEDGE_PERCENTILE)
+        if latency_ms is None:
+            return Config.HEDGE_DEFAULT_DELAY
+        return latency_ms / 1000
+    
+    async def _create_completion(self, model: str, messages: List[Dict[str, str]],
+                                 timeout: float) -> Tuple[str, object, float]:
+        """Run a single completion request, returns model, response and latency"""
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=0.7,
+            max_tokens=1000,
+            timeout=timeout
+        )
+        return model, response, (time.perf_counter() - started) * 1000
+    
+    def _record_cancelled(self, user_id: Optional[int], model: str,
+                          messages: List[Dict[str, str]], elapsed_ms: float) -> None:
+        """Account a cancelled request, whose prompt was most likely billed upstream"""
+        prompt_tokens = self.router.estimate_tokens(messages)
+        self.stats["cancelled_attempts"] += 1
+        self.stats["cancelled_prompt_tokens"] += prompt_tokens
+        if self.usage_tracker is not None:
+            self.usage_tracker.record_tokens(user_id, model, prompt_tokens, 0, elapsed_ms, discarded=True)
+    
+    def _record_discarded(self, user_id: Optional[int], model: str, response, latency_ms: float) -> None:
+        """Account a completed answer that lost the race to another one"""
+        self.stats["discarded_answers"] += 1
+        self.router.observe(model, latency_ms)
+        if self.usage_tracker is not None:
+            self.usage_tracker.record(user_id, model, response.usage, latency_ms, discarded=True)
+    
+    async def _complete_with_hedging(self, model: str, messages: List[Dict[str, str]],
+                                     deadline: float, user_id: Optional[int] = None) -> Tuple[str, object, float]:
+        """
+        Run a completion within a deadline, hedging to a fallback model
+        
+        A second request to the fallback model is sent when the primary one is
+        slower than its latency percentile (hedge) or fails (fallback). The
+        first successful answer wins and the other request is cancelled; if both
+        answers arrive together the primary wins and the other one is recorded
+        as discarded. A
+        cancelled primary still reports its elapsed time to the router as a
+        lower bound, so stragglers are not dropped from the latency window.
+        Every cancelled request is recorded in usage as discarded, with an
+        estimated prompt token count, since it is billed upstream anyway.
+        
+        Raises:
+            asyncio.TimeoutError: if no answer arrived before the deadline
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline_at = started + deadline
+        hedge_at = started + self._hedge_delay(model)
+        can_hedge = Config.HEDGING_ENABLED and hedge_at < deadline_at
+        
+        primary = asyncio.create_task(self._create_completion(model, messages, deadline))
+        attempts = {primary: (model, started)}
+        pending = {primary}
+        second_kind = None
+        errors = []
+        
+        try:
+            while pending:
+                now = loop.time()
+                if now >= deadline_at:
+                    break
+                wait_until = min(deadline_at, hedge_at) if can_hedge and second_kind is None else deadline_at
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(wait_until - now, 0),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                succeeded = [task for task in done if task.exception() is None]
+                errors.extend(task.exception() for task in done if task.exception() is not None)
+                if succeeded:
+                    winner = primary if primary in succeeded else succeeded[0]
+                    for task in succeeded:
+                        if task is not winner:
+                            self._record_discarded(user_id, *task.result())
+                    if winner is not primary:
+                        self.stats[f"{second_kind}_wins"] += 1
+                    return winner.result()
+                
+                now = loop.time()
+                if second_kind is None and now < deadline_at and (errors or (can_hedge and now >= hedge_at)):
+                    second_kind = "fallback" if errors else "hedge"
+                    fallback = self._fallback_model(model)
+                    self.stats["fallbacks" if errors else "hedged"] += 1
+                    logger.info(
+                        f"{'Falling back' if errors else 'Hedging'} from {model} to {fallback} "
+                        f"after {now - started:.1f}s"
+                    )
+                    task = asyncio.create_task(
+                        self._create_completion(fallback, messages, deadline_at - now)
+                    )
+                    attempts[task] = (fallback, now)
+                    pending.add(task)
+        finally:
+            now = loop.time()
+            for task in pending:
+                task.cancel()
+                attempt_model, attempt_started = attempts[task]
+                elapsed_ms = (now - attempt_started) * 1000
+                if task is primary:
+                    self.router.observe(attempt_model, elapsed_ms)
+                self._record_cancelled(user_id, attempt_model, messages, elapsed_ms)
+        
+        if errors and len(errors) == len(attempts):
+            raise errors[0]
+        raise asyncio.TimeoutError(f"No completion within {deadline:.1f}s")
+    
     def _format_messages(self, history: List[Conversation], user_message: str) -> List[Dict[str, str]]:
         """Format conversation history for OpenAI API"""
         messages = []
@@ -48,26 +216,32 @@ class OpenAIService:
         
         return messages
     
-    async def get_response(self, user_message: str, history: List[Conversation]) -> Optional[str]:
+    async def get_response(self, user_message: str, history: List[Conversation],
+                           user_id: Optional[int] = None, model: Optional[str] = None,
+                           deadline: float = Config.REQUEST_DEADLINE) -> Optional[str]:
         """
         Get AI response from OpenAI
         
         Args:
             user_message: User's message
             history: Conversation history
+            user_id: Telegram user ID, used for usage accounting
+            model: Model chosen by user, the default model if None
+            deadline: Time budget in seconds for the whole request, including hedging
             
         Returns:
             AI response or None if error occurred
         """
         try:
             messages = self._format_messages(history, user_message)
+            model = self.resolve_model(messages, model)
             
-            response = await self.client.chat.completions.create(
-                model=self.current_model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
-            )
+            self.stats["requests"] += 1
+            model, response, latency_ms = await self._complete_with_hedging(model, messages, deadline, user_id)
+            self.router.observe(model, latency_ms)
+            
+            if self.usage_tracker is not None:
+                self.usage_tracker.record(user_id, model, response.usage, latency_ms)
             
             if response.choices and len(response.choices) > 0:
                 return response.choices[0].message.content
@@ -75,6 +249,11 @@ class OpenAIService:
                 logger.warning("Empty response from OpenAI API")
                 return None
                 
+        except (asyncio.TimeoutError, APITimeoutError) as e:
+            self.stats["deadline_misses"] += 1
+            logger.error(f"OpenAI API deadline of {deadline:.1f}s exceeded: {e}")
+            raise Exception("AI отвечает слишком долго. Попробуйте позже или задайте вопрос короче.")
+        
         except RateLimitError as e:
             logger.error(f"OpenAI API rate limit exceeded: {e}")
             raise Exception("Превышен лимит запросов к API. Пожалуйста, попробуйте позже.")
@@ -0,0 +1,109 @@
+"""
+Sampling profiler for the bot event loop
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running"""
+
+
+@dataclass(frozen=True)
+class ProfileResult:
+    """Outcome of one profiling run"""
+    samples: int
+    top: Tuple[Tuple[str, int, int], ...]
+    collapsed_stacks: str
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread from a background thread.
+
+    Nothing runs between profiles; while profiling the overhead is one stack
+    walk per sample interval. Only one profile runs at a time.
+    """
+
+    def __init__(self, interval: float = Config.PROFILE_SAMPLE_INTERVAL):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+
+    def _sample(self, thread_id: int, stop: threading.Event,
+                self_counts: Counter, total_counts: Counter, stacks: Counter) -> None:
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+
+            self_counts[stack[-1]] += 1
+            for label in set(stack):
+                total_counts[label] += 1
+            stacks[";".join(stack)] += 1
+
+    async def run(self, seconds: float, top_n: int = Config.PROFILE_TOP_N,
+                  on_start: Optional[Callable[[], Awaitable[object]]] = None) -> ProfileResult:
+        """
+        Profile the calling event loop thread for the given number of seconds
+
+        Args:
+            seconds: Length of the profiling window
+            top_n: Number of hottest functions to report
+            on_start: Awaited once the profiler is reserved, before sampling
+
+        Raises:
+            ProfilerBusyError: if another profile is running
+        """
+        if self._lock.locked():
+            raise ProfilerBusyError("Profiler is already running")
+        async with self._lock:
+            if on_start is not None:
+                await on_start()
+
+            self_counts: Counter = Counter()
+            total_counts: Counter = Counter()
+            stacks: Counter = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), stop, self_counts, total_counts, stacks),
+                name="sampling-profiler", daemon=True
+            )
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+
+        samples = sum(self_counts.values())
+        logger.info(f"Collected {samples} profile samples in {seconds}s")
+        return ProfileResult(
+            samples=samples,
+            top=tuple(
+                (label, count, total_counts[label])
+                for label, count in self_counts.most_common(top_n)
+            ),
+            collapsed_stacks="\n".join(
+                f"{stack} {count}" for stack, count in stacks.most_common()
+            ) + "\n"
+        )
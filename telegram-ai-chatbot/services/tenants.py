@@ -0,0 +1,118 @@
+"""
+Tenants for serving several bots from one process
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from aiogram import Bot, BaseMiddleware
+from aiogram.types import TelegramObject
+from openai import AsyncOpenAI
+from config import Config, TenantConfig
+from database.queries import Database
+from services.model_router import ModelRouter
+from services.openai_service import OpenAIService
+from services.usage_tracker import UsageTracker
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_SETTING = "default_model"
+
+
+class Tenant:
+    """Per-bot state: its own database, usage tracker and model settings"""
+
+    def __init__(self, config: TenantConfig, client: AsyncOpenAI, router: ModelRouter):
+        self.config = config
+        self.db = Database(config.database_path)
+        self.usage_tracker = UsageTracker(self.db)
+        self.openai_service = OpenAIService(
+            usage_tracker=self.usage_tracker, client=client, router=router
+        )
+        self.openai_service.set_model(config.default_model)
+
+    @property
+    def name(self) -> str:
+        return self.config.name
+
+    def is_admin(self, user_id: int) -> bool:
+        """Check if user is admin of this tenant"""
+        return self.config.is_admin(user_id)
+
+    async def init(self) -> None:
+        """Initialize database and load the persisted default model"""
+        await self.db.init_db()
+        default_model = await self.db.get_setting(DEFAULT_MODEL_SETTING)
+        if default_model and self.openai_service.set_model(default_model):
+            logger.info(f"Tenant {self.name}: loaded default model {default_model}")
+
+
+class TenantRegistry:
+    """
+    Tenants of this process and the resources they share.
+
+    All tenants use one OpenAI HTTP client, one latency router and one
+    background task that flushes their usage trackers.
+    """
+
+    def __init__(self, configs: List[TenantConfig], api_key: Optional[str] = None,
+                 flush_interval: float = Config.USAGE_FLUSH_INTERVAL):
+        self.client = AsyncOpenAI(api_key=api_key or Config.OPENAI_API_KEY())
+        self.router = ModelRouter()
+        self.flush_interval = flush_interval
+        self.tenants: Dict[int, Tenant] = {}
+        self._configs = configs
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def get(self, bot_id: int) -> Optional[Tenant]:
+        """Get tenant serving the bot"""
+        return self.tenants.get(bot_id)
+
+    async def flush(self) -> None:
+        """Write buffered usage of all tenants"""
+        await asyncio.gather(*(t.usage_tracker.flush() for t in self.tenants.values()))
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        """Initialize tenants and start background usage flushing"""
+        for config in self._configs:
+            self.tenants[config.bot_id] = Tenant(config, self.client, self.router)
+        await asyncio.gather(*(t.init() for t in self.tenants.values()))
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+        logger.info(f"Initialized {len(self.tenants)} tenant(s)")
+
+    async def stop(self) -> None:
+        """Stop background flushing, write remaining usage and close the shared client"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        await self.client.close()
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Passes the tenant of the receiving bot to handlers as `tenant`"""
+
+    def __init__(self, registry: TenantRegistry):
+        self.registry = registry
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        bot: Bot = data["bot"]
+        tenant = self.registry.get(bot.id)
+        if tenant is None:
+            logger.warning(f"Dropping update for unknown bot {bot.id}")
+            return None
+        data["tenant"] = tenant
+        return await handler(event, data)
@@ -0,0 +1,81 @@
+"""
+Usage tracker for batching token usage records into the database
+"""
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+from config import Config
+from database.models import UsageRecord
+from database.queries import Database
+
+logger = logging.getLogger(__name__)
+
+
+class UsageTracker:
+    """Buffers completion usage and writes it to the database in batches"""
+
+    def __init__(self, db: Database, batch_size: int = Config.USAGE_BATCH_SIZE,
+                 max_buffer: int = Config.USAGE_MAX_BUFFER):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self._buffer: List[UsageRecord] = []
+        self._pending_flushes: set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    def record(self, user_id: Optional[int], model: str, usage, latency_ms: float,
+               discarded: bool = False) -> None:
+        """
+        Queue usage of a single completion
+
+        Args:
+            user_id: Telegram user ID the completion was made for
+            model: Model that produced the completion
+            usage: `usage` object of the OpenAI response (may be None)
+            latency_ms: Request latency in milliseconds
+            discarded: The answer was not used, e.g. it lost a hedged race
+        """
+        self.record_tokens(
+            user_id, model,
+            prompt_tokens=getattr(usage, "prompt_tokens", 0) or 0,
+            completion_tokens=getattr(usage, "completion_tokens", 0) or 0,
+            latency_ms=latency_ms,
+            discarded=discarded
+        )
+
+    def record_tokens(self, user_id: Optional[int], model: str, prompt_tokens: int,
+                      completion_tokens: int, latency_ms: float, discarded: bool = False) -> None:
+        """Queue usage given as token counts, e.g. estimated for a cancelled request"""
+        self._buffer.append(UsageRecord(
+            user_id=user_id,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+            latency_ms=latency_ms,
+            created_at=datetime.now(timezone.utc),
+            discarded=discarded
+        ))
+
+        if len(self._buffer) >= self.batch_size:
+            task = asyncio.get_running_loop().create_task(self.flush())
+            self._pending_flushes.add(task)
+            task.add_done_callback(self._pending_flushes.discard)
+
+    async def flush(self) -> None:
+        """Write all buffered records to the database"""
+        async with self._lock:
+            if not self._buffer:
+                return
+            records, self._buffer = self._buffer, []
+            try:
+                await self.db.add_usage_records(records)
+                logger.debug(f"Flushed {len(records)} usage records")
+            except Exception as e:
+                logger.error(f"Failed to flush usage records, keeping them for retry: {e}")
+                self._buffer = records + self._buffer
+                overflow = len(self._buffer) - self.max_buffer
+                if overflow > 0:
+                    del self._buffer[:overflow]
+                    logger.warning(f"Usage buffer is full, dropped {overflow} oldest records")